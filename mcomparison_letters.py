@@ -1,118 +1,255 @@
-import numpy as np
-from string import ascii_lowercase
-from itertools import combinations
-
-def mcomparison_letters(p_values, significance_level = 0.05, return_numbers = False):
-    """
-    Compute letters that represent multiple comparisons between groups
-   
-    Arguments:
-    ---------------
-    p_valies: float array
-        corrected p-values for each pairwise comparison,
-        e.g. for 3 groups, [0.03, 0.001, 0.6] to indicate that at 0.05
-        significance level: group1 != group 2; group1 != group3; and group2 = group3
-
-    significance_level: float
-        error rate used to establish significancy of differences
-
-    return_numbers: bool
-        if True array of numbers is returned, instead of letters
-
-    Returns:
-    ---------------
-    final_letters: list of lists
-        list of list of letters/ numbers that describe multiple comparisons for each group
-        e.g. from above, [['a'], ['b'], ['b']]
-        e.g. from above for significance_level of 0.01, [['a'], ['a', 'b'], ['b']]
-    """
-        
-    
-    # Input preparation
-    # -------------------------------------------------------------------------
-    
-    p_values = np.array(p_values).flatten()    
-    
-    # Calculate number of groups
-    n_groups = 0
-    comparisons = len(p_values)
-    while comparisons > 0:
-        n_groups += 1
-        comparisons -= n_groups
-    n_groups += 1
-    if comparisons < 0:
-        raise ValueError('Invalid number of p_values. Must be a triangular number (1+2+3+4+...+n)')
-            
-    # Convert p-values to boolean and 
-    # Rearrange them into a nested list [[1vs2, 1vs3, 1vs4], [2vs3, 2vs4], [3vs4]]
-    p_values = p_values <= significance_level
-    nested_p_values = [[] for _ in range(n_groups - 1)]
-    for icomb, comb in enumerate((combinations(range(n_groups), 2))):
-        nested_p_values[comb[0]].append(p_values[icomb])
-            
-        
-    # Letter assignment loop
-    # ------------------------------------------------------------------------- 
-    
-    final_letters = [set([]) for _ in range(n_groups)]
-    current_letter, max_letter, new_value_assigned = 1, 1, False
-    for i in range(n_groups):                        
-        new_value_assigned = False
-                
-        # If set is empty: Automatically assign new letter
-        if not len(final_letters[i]):
-            final_letters[i].add(current_letter)
-            new_value_assigned = True
-            
-        if i == len(final_letters)-1:
-            break
-                 
-        # Loop through next groups, looking for similar cases
-        current_letters = final_letters[i]
-        for j, significant_pval in enumerate(nested_p_values[i]):
-            
-            if not significant_pval:
-            
-                # Check if similar group already shares the letter
-                for letter in final_letters[i+j+1]:
-                    if letter in current_letters:
-                        break
-                        
-                # If it does not, must assign it
-                else:
-                    new_value_assigned = True
-                    offset = 0                   
-                    
-                    # Check if there are conflicting groups in between that may require adding a new letter
-                    # Example instead of (i: a, mid: a, j: a), we have (i: ab, mid: a, j:b)
-                    for mid, significant_mid_pval in enumerate(nested_p_values[i][:j]):
-                        if not significant_mid_pval: #(i = mid)             
-                            if nested_p_values[i+mid+1][j-mid-1]: #(mid != j)    
-                                if current_letter+offset in final_letters[i+mid+1]: #(mid contains new letter)
-                                # In the example: [['a', 'b'], ['a', 'c'], ['a'], ['b', 'c']]
-                                # The 'b' (1st loop) is a result of an offset, whereas the 'c' (2nd loop) is not
-                                # because the 3rd group is already assigned a different value (i.e., 'a') by then  
-                                    offset += 1
-                                                                        
-                    # If there is a new letter assing it retroactively (i:a -> i:a,b)
-                    # ... And finally assing it to the new group (j: new letter)
-                    final_letters[i].add(current_letter+offset)
-                    final_letters[i+j+1].add(current_letter+offset)
-                        
-                    if current_letter+offset > max_letter:
-                        max_letter = current_letter+offset  
-                        
-        # Update to next letter
-        if new_value_assigned and max_letter >= current_letter:
-            max_letter += 1
-            current_letter = max_letter
-
-
-    # Return output
-    # -------------------------------------------------------------------------
-    
-    if return_numbers:
-        return [[l for l in letter ] for letter in final_letters]
-    
-    alphabet = dict(enumerate(ascii_lowercase, 1))
-    return [[alphabet[l] for l in letter ] for letter in final_letters]
+import math
+import numpy as np
+from string import ascii_lowercase
+from functools import lru_cache
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
+
+def _assign_letters(sig, n_groups):
+    """
+    Letter assignment loop (JIT-compiled when numba is available)
+
+    sig is the boolean significance matrix (sig[i, j] = groups i and j differ,
+    for i < j) and the returned array holds one uint64 bitmask per group,
+    where bit k set means letter number k was assigned to that group.
+    """
+
+    one = np.uint64(1)
+    letters = np.zeros(n_groups, np.uint64)
+    current_letter, max_letter, new_value_assigned = 1, 1, False
+    for i in range(n_groups):
+        new_value_assigned = False
+
+        # If mask is empty: Automatically assign new letter
+        if letters[i] == 0:
+            if current_letter > 63:
+                raise ValueError('Comparison pattern needs more than 63 distinct letters, '
+                                 'which does not fit the uint64 bitmask representation')
+            letters[i] |= one << np.uint64(current_letter)
+            new_value_assigned = True
+
+        if i == n_groups - 1:
+            break
+
+        # Loop through next groups, looking for similar cases
+        for j in range(i + 1, n_groups):
+
+            # Skip different groups, and similar ones that already share a letter
+            # with group i (a single bitmask intersection test)
+            if sig[i, j] or letters[j] & letters[i]:
+                continue
+
+            new_value_assigned = True
+            offset = 0
+
+            # Check if there are conflicting groups in between that may require adding a new letter
+            # Example instead of (i: a, mid: a, j: a), we have (i: ab, mid: a, j:b)
+            for mid in range(i + 1, j):
+                if not sig[i, mid]:  # (i = mid)
+                    if sig[mid, j]:  # (mid != j)
+                        if letters[mid] & (one << np.uint64(current_letter + offset)):  # (mid contains new letter)
+                            # In the example: [['a', 'b'], ['a', 'c'], ['a'], ['b', 'c']]
+                            # The 'b' (1st loop) is a result of an offset, whereas the 'c' (2nd loop) is not
+                            # because the 3rd group is already assigned a different value (i.e., 'a') by then
+                            offset += 1
+
+            # If there is a new letter assing it retroactively (i:a -> i:a,b)
+            # ... And finally assing it to the new group (j: new letter)
+            # Shifts wrap mod 64 on uint64, so refuse letter numbers past bit 63
+            # instead of silently aliasing low letters
+            if current_letter + offset > 63:
+                raise ValueError('Comparison pattern needs more than 63 distinct letters, '
+                                 'which does not fit the uint64 bitmask representation')
+            letters[i] |= one << np.uint64(current_letter + offset)
+            letters[j] |= one << np.uint64(current_letter + offset)
+
+            if current_letter + offset > max_letter:
+                max_letter = current_letter + offset
+
+        # Update to next letter
+        if new_value_assigned and max_letter >= current_letter:
+            max_letter += 1
+            current_letter = max_letter
+
+    return letters
+
+
+# The bitmask set operations are plain uint64 arithmetic, so the same loop
+# runs unmodified (just slower) when numba is not installed
+if njit is not None:
+    _assign_letters = njit(cache=True)(_assign_letters)
+
+
+def _assign_letters_batch(sig_batch):
+    """
+    Letter assignment over a batch of significance matrices, with each
+    (independent) set handled by a parallel thread when numba is available
+    """
+
+    n_sets, n_groups = sig_batch.shape[0], sig_batch.shape[1]
+    letters = np.zeros((n_sets, n_groups), np.uint64)
+    for k in prange(n_sets):
+        letters[k] = _assign_letters(sig_batch[k], n_groups)
+    return letters
+
+
+if njit is not None:
+    _assign_letters_batch = njit(parallel=True, cache=True)(_assign_letters_batch)
+
+
+def _n_groups_from_comparisons(comparisons):
+    """
+    Invert the triangular relation comparisons = n_groups * (n_groups-1) / 2
+    (math.isqrt keeps the formula exact for any input size)
+    """
+
+    # comparisons is triangular exactly when the discriminant is a perfect
+    # square, so invalid input is rejected before anything is derived from it
+    disc = 1 + 8 * comparisons
+    s = math.isqrt(disc)
+    if s * s != disc:
+        raise ValueError('Invalid number of p_values. Must be a triangular number (1+2+3+4+...+n)')
+    return (1 + s) // 2
+
+
+@lru_cache(maxsize=1024)
+def _letters_from_sig_bytes(sig_bytes, n_groups):
+    """
+    Memoized letter assignment for a packed significance pattern
+
+    sig_bytes is the np.packbits-packed upper triangle of the significance
+    matrix. Different raw p-values often reduce to the same pattern (e.g. in
+    resampling loops), so the assignment loop only runs once per pattern.
+    Returns a tuple of letter bitmasks, one per group.
+    """
+
+    sig = np.zeros((n_groups, n_groups), np.bool_)
+    sig[np.triu_indices(n_groups, k=1)] = np.unpackbits(
+        np.frombuffer(sig_bytes, np.uint8), count=n_groups * (n_groups - 1) // 2)
+
+    return tuple(map(int, _assign_letters(sig, n_groups)))
+
+
+def _decode_masks(letter_masks, return_numbers):
+    """
+    Decode per-group letter bitmasks into lists of letters (or numbers),
+    extracting all the bits with one vectorized shift-and-mask
+    """
+
+    masks = np.asarray(letter_masks, np.uint64)
+    max_letter = int(masks.max()).bit_length() - 1
+    bits = (masks[:, None] >> np.arange(1, max_letter + 1, dtype=np.uint64)) & np.uint64(1)
+    bits = bits.astype(np.bool_)
+
+    if return_numbers:
+        symbols = np.arange(1, max_letter + 1)
+    else:
+        symbols = np.array(list(ascii_lowercase[:max_letter]))
+    return [symbols[row].tolist() for row in bits]
+
+
+def mcomparison_letters(p_values, significance_level = 0.05, return_numbers = False):
+    """
+    Compute letters that represent multiple comparisons between groups
+
+    Arguments:
+    ---------------
+    p_valies: float array
+        corrected p-values for each pairwise comparison,
+        e.g. for 3 groups, [0.03, 0.001, 0.6] to indicate that at 0.05
+        significance level: group1 != group 2; group1 != group3; and group2 = group3
+
+    significance_level: float
+        error rate used to establish significancy of differences
+
+    return_numbers: bool
+        if True array of numbers is returned, instead of letters
+
+    Returns:
+    ---------------
+    final_letters: list of lists
+        list of list of letters/ numbers that describe multiple comparisons for each group
+        e.g. from above, [['a'], ['b'], ['b']]
+        e.g. from above for significance_level of 0.01, [['a'], ['a', 'b'], ['b']]
+    """
+
+
+    # Input preparation
+    # -------------------------------------------------------------------------
+
+    p_values = np.array(p_values).flatten()
+
+    # Calculate number of groups (n comparisons is the triangular number of n_groups - 1)
+    n_groups = _n_groups_from_comparisons(len(p_values))
+
+    # Convert p-values to a packed boolean significance pattern
+    sig = p_values <= significance_level
+
+
+    # Letter assignment loop (memoized on the significance pattern)
+    # -------------------------------------------------------------------------
+
+    letter_masks = _letters_from_sig_bytes(np.packbits(sig).tobytes(), n_groups)
+
+
+    # Return output
+    # -------------------------------------------------------------------------
+
+    return _decode_masks(letter_masks, return_numbers)
+
+
+def mcomparison_letters_batch(p_values_matrix, significance_level = 0.05, return_numbers = False):
+    """
+    Compute multiple comparison letters for many sets of p-values at once
+
+    Equivalent to calling mcomparison_letters on every row, but the letter
+    assignment runs as a single numba-parallel call over the batch, which is
+    much faster for permutation / bootstrap pipelines.
+
+    Arguments:
+    ---------------
+    p_values_matrix: 2D float array
+        one row of corrected pairwise p-values per set, laid out as in
+        mcomparison_letters. All rows must describe the same number of groups
+
+    significance_level: float
+        error rate used to establish significancy of differences
+
+    return_numbers: bool
+        if True arrays of numbers are returned, instead of letters
+
+    Returns:
+    ---------------
+    final_letters: list of lists of lists
+        mcomparison_letters output for each row of p_values_matrix
+    """
+
+
+    # Input preparation
+    # -------------------------------------------------------------------------
+
+    p_values_matrix = np.atleast_2d(np.asarray(p_values_matrix))
+    n_sets = p_values_matrix.shape[0]
+    n_groups = _n_groups_from_comparisons(p_values_matrix.shape[1])
+
+    # Convert p-values to a batch of boolean significance matrices
+    sig_batch = np.zeros((n_sets, n_groups, n_groups), np.bool_)
+    iu = np.triu_indices(n_groups, k=1)
+    sig_batch[:, iu[0], iu[1]] = p_values_matrix <= significance_level
+
+
+    # Letter assignment loop (parallel across sets)
+    # -------------------------------------------------------------------------
+
+    letter_masks = _assign_letters_batch(sig_batch)
+
+
+    # Return output
+    # -------------------------------------------------------------------------
+
+    return [_decode_masks(row, return_numbers) for row in letter_masks]
@@ -1,4 +1,10 @@
-def percentile(x, p, method=7):
+import numpy as np
+
+# Coefficients (a, b) such that npm = p * (n+a) + b, for continuous methods 4-9
+_CONT_AB = np.array([(0, 0), (0, 0.5), (1, 0), (-1, 1), (1/3, 1/3), (1/4, 3/8)])
+
+
+def percentile(x, p, method=7, assume_sorted=False):
     '''
     Computes the qth percentile of the data. 
     Offers 8 additional methods not available in Numpy.
@@ -10,10 +16,14 @@ def percentile(x, p, method=7):
     p : float or array_like
         Percentile(s) to compute, must be between 0 and 100 inclusive.
     method : integer
-        Optional parameter that specifies one of the nine sampling 
+        Optional parameter that specifies one of the nine sampling
         methods discussed in Hyndman and Fan (1996), must be between
-        1 and 9 inclusive. 
-    
+        1 and 9 inclusive.
+    assume_sorted : bool
+        If True, x is taken to be already sorted in ascending order and
+        the internal sort / partition is skipped. Useful when computing
+        many percentiles on the same data.
+
     Returns:
     ---------------
         Numpy array with the percentile-corresponding values of x.
@@ -66,60 +76,60 @@ def percentile(x, p, method=7):
     # -------------------------------------------------------------------------
     if method < 1 or method > 9:
         raise ValueError('Invalid method. Must be an integer beween 1 and 9')
-    if np.isscalar(p):
-        p = [p]
-    
     x = np.asarray(x)
-    x.sort()
-    p = np.asarray(p)/100
-    n = x.size  
+    p = np.atleast_1d(np.asarray(p, dtype=np.float64)) / 100
+    n = x.size
     
     # Compute indexes and indexes masks / fractionals
     # -------------------------------------------------------------------------
-    if method < 4:       
+    if method < 4:
         m = (0, 0, -0.5)[method-1]
         npm = p * n + m
-        index = np.floor(npm).astype(np.int)
-        index_frac = npm % 1           
-        
-        im0 = [0, 0.5, 0][method-1] 
-        index_mask = np.ones(p.size)
-        if method < 3:
-            index_mask[(index_frac == 0)] = im0
-        else:
-            index_mask[(index_frac == 0) & (index%2 == 0)] = im0      
-
     else:
-        if method == 4:
-            npm = p * n
-        elif method == 5:
-            npm = p * n + .5
-        elif method == 6:
-            npm = p * (n+1)
-        elif method == 7:
-            npm = p * (n-1) + 1
-        elif method == 8:
-            npm = p * (n+1/3) + 1/3
-        elif method == 9:
-            npm = p * (n+1/4) + 3/8
+        a, b = _CONT_AB[method-4]
+        npm = p * (n+a) + b
 
-        index = np.floor(npm).astype(np.int)
-        index_frac = npm % 1
+    # npm % 1 would recompute the floor internally; reuse the one already
+    # needed for the indexes and turn npm into the fractional part in place
+    floor_npm = np.floor(npm)
+    index = floor_npm.astype(np.intp)
+    index_frac = np.subtract(npm, floor_npm, out=npm)
+
+    if method < 4:
+        im0 = [0, 0.5, 0][method-1]
+        if method < 3:
+            index_mask = np.where(index_frac == 0, im0, 1.0)
+        else:
+            index_mask = np.where((index_frac == 0) & ((index & 1) == 0), im0, 1.0)
 
     # Adjust indexes
     # -------------------------------------------------------------------------      
-    index_ = index.copy()
-    index[index <= 0] = 1
-    index[index  > n] = n
-    index_[index_ < 0] = 0
-    index_[index_ >= n] = n-1
-    
+    index_ = np.clip(index, 0, n-1)
+    index = np.clip(index, 1, n)
+
+    # Gather the needed order statistics
+    # -------------------------------------------------------------------------
+    # When only a few order statistics are needed, np.partition finds them
+    # in O(n) instead of the O(n log n) of a full sort
+    if not assume_sorted:
+        kth = np.unique(np.concatenate((index - 1, index_)))
+        if kth.size < n / max(np.log2(n), 1):
+            x = np.partition(x, kth)
+        else:
+            x = np.sort(x)
+
     i = x[index - 1]
     j = x[index_]
     
     # Return output
     # -------------------------------------------------------------------------
-    if method < 4:         
+    if method < 4:
+        # Discontinuous methods select actual sample values (or their exact
+        # midpoint), so keep the exact selection form
         return (1-index_mask) * i + index_mask * j
     else:
-        return i + index_frac * (j-i)   
+        # Fused interpolation, built with in-place arithmetic to avoid
+        # intermediate arrays
+        out = (j-i) * index_frac
+        out += i
+        return out
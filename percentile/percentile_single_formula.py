@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def percentile_single_formula(x, p, method=7):
     '''
     Computes the qth percentile of the data. 
@@ -70,17 +73,14 @@ def percentile_single_formula(x, p, method=7):
     # -------------------------------------------------------------------------
     if method < 1 or method > 9:
         raise ValueError('Invalid method. Must be an integer beween 1 and 9')
-    if np.isscalar(p):
-        p = [p]
-    
     x = np.asarray(x)
     x.sort()
-    p = np.array(p)/100
-    n = x.size  
+    p = np.atleast_1d(np.asarray(p, dtype=np.float64)) / 100
+    n = x.size
     
     m = (0, 0, -0.5, 0, 0.5, p, 1-p, (p+1)/3, p/4+3/8)[method-1]
     npm = n*p+m
-    index = np.floor(npm).astype(np.int)
+    index = np.floor(npm).astype(np.intp)
     index_frac = npm % 1
            
     # Compute indexes and indexes masks / fractionals
@@ -97,13 +97,10 @@ def percentile_single_formula(x, p, method=7):
 
     # Adjust indexes and return output
     # -------------------------------------------------------------------------       
-    index_ = index.copy()
-    index[index_ <= 0] = 1
-    index[index_  > n] = n
-    index_[index_ < 0] = 0
-    index_[index_ >= n] = n-1
+    index_ = np.clip(index, 0, n-1)
+    index = np.clip(index, 1, n)
     
     i = x[index - 1]
     j = x[index_]
-    
+
     return (1-index_mask)*i + index_mask*j